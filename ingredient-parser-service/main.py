@@ -1,11 +1,30 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 from typing import List, Optional
 from ingredient_parser import parse_ingredient
-import uvicorn
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
+import functools
+import os
+import re
 
-app = FastAPI(title="Ingredient Parser Service")
+app = FastAPI(title="Ingredient Parser Service", default_response_class=ORJSONResponse)
+
+# Process pool for the CPU-bound NLP parsing (threads don't help here because
+# parse_ingredient is pure-Python work that holds the GIL). The cores are
+# split across however many web workers start.sh launches (WORKERS, default
+# 1) so the pools don't multiply per worker and oversubscribe the host
+_POOL_WORKERS = max(1, (os.cpu_count() or 1) // int(os.getenv("WORKERS", "1")))
+_PROCESS_POOL = ProcessPoolExecutor(max_workers=_POOL_WORKERS)
+
+# Above this batch size, one task per ingredient spends more time on IPC than
+# parsing, so switch to a chunked map over the pool instead
+_CHUNKED_BATCH_THRESHOLD = 64
+
+# Matches a leading quantity, including mixed fractions like "1 1/2"
+_QTY_RE = re.compile(r'^(\d+(?:\s+\d+/\d+|\.\d+|/\d+)?)\s+')
 
 # Add CORS middleware to allow requests from the Remix app
 app.add_middleware(
@@ -36,10 +55,16 @@ class BatchParseResponse(BaseModel):
 def read_root():
     return {"message": "Ingredient Parser Service", "version": "1.0.0"}
 
-def safe_parse_ingredient(text: str) -> ParsedIngredient:
-    """Safely parse an ingredient with proper error handling"""
+@functools.lru_cache(maxsize=20000)
+def _parse_cached(text: str) -> tuple:
+    """Run the NLP pipeline and return (name, quantity, unit, comment).
+
+    Recipe corpora repeat the same ingredient lines constantly ("2 eggs",
+    "salt to taste"), so results are memoized. Only plain tuples are cached,
+    not the Pydantic models built from them. Note each process-pool worker
+    keeps its own cache.
+    """
     try:
-        import re
         parsed = parse_ingredient(text)
         
         # Extract name safely
@@ -52,7 +77,7 @@ def safe_parse_ingredient(text: str) -> ParsedIngredient:
         unit = None
         
         # First try to extract original quantity format from text to preserve mixed fractions
-        quantity_match = re.match(r'^(\d+(?:\s+\d+/\d+|\.\d+|/\d+)?)\s+', text.strip())
+        quantity_match = _QTY_RE.match(text)
         if quantity_match:
             quantity = quantity_match.group(1)
         
@@ -85,38 +110,54 @@ def safe_parse_ingredient(text: str) -> ParsedIngredient:
         # Clean up name
         if name:
             name = name.strip().rstrip(',').strip()
-        
-        return ParsedIngredient(
-            name=name or text,  # Fallback to original text if name is empty
-            quantity=quantity,
-            unit=unit,
-            comment=comment,
-            original_text=text
-        )
-    
+
+        # Fallback to original text if name is empty
+        return (name or text, quantity, unit, comment)
+
     except Exception as e:
         # Fallback parsing if NLP fails
-        return ParsedIngredient(
-            name=text,
-            quantity=None,
-            unit=None,
-            comment=None,
-            original_text=text
-        )
+        return (text, None, None, None)
+
+def safe_parse_ingredient(text: str) -> ParsedIngredient:
+    """Safely parse an ingredient with proper error handling"""
+    name, quantity, unit, comment = _parse_cached(text.strip())
+    # The tuple fields are strings/None we produced ourselves (including the
+    # fallback case), so build the model without re-running validation
+    return ParsedIngredient.model_construct(
+        name=name,
+        quantity=quantity,
+        unit=unit,
+        comment=comment,
+        original_text=text
+    )
 
 @app.post("/parse", response_model=ParsedIngredient)
-def parse_single_ingredient(ingredient: IngredientInput):
+async def parse_single_ingredient(ingredient: IngredientInput):
     """Parse a single ingredient text"""
-    return safe_parse_ingredient(ingredient.text)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_PROCESS_POOL, safe_parse_ingredient, ingredient.text)
+
+def _parse_chunked(texts: List[str]) -> List[ParsedIngredient]:
+    """Parse a large batch through the pool with chunking to amortize IPC overhead"""
+    chunksize = max(1, len(texts) // (4 * (os.cpu_count() or 1)))
+    return list(_PROCESS_POOL.map(safe_parse_ingredient, texts, chunksize=chunksize))
 
 @app.post("/parse-batch", response_model=BatchParseResponse)
-def parse_batch_ingredients(batch: BatchIngredientInput):
+async def parse_batch_ingredients(batch: BatchIngredientInput):
     """Parse multiple ingredients at once"""
-    parsed_ingredients = []
-    
-    for ingredient_text in batch.ingredients:
-        parsed_ingredients.append(safe_parse_ingredient(ingredient_text))
-    
+    loop = asyncio.get_running_loop()
+
+    if len(batch.ingredients) > _CHUNKED_BATCH_THRESHOLD:
+        # Chunked map keeps IPC overhead low on big batches; run it in the
+        # default thread pool so the event loop isn't blocked waiting on it
+        parsed_ingredients = await loop.run_in_executor(None, _parse_chunked, batch.ingredients)
+    else:
+        # One task per ingredient spreads the work across all cores
+        parsed_ingredients = await asyncio.gather(*[
+            loop.run_in_executor(_PROCESS_POOL, safe_parse_ingredient, text)
+            for text in batch.ingredients
+        ])
+
     return BatchParseResponse(ingredients=parsed_ingredients)
 
 @app.get("/health")
@@ -124,5 +165,43 @@ def health_check():
     """Health check endpoint"""
     return {"status": "healthy"}
 
+def _worker_cache_info() -> tuple:
+    """Report this worker's cache counters, keyed by pid for deduplication"""
+    info = _parse_cached.cache_info()
+    return (os.getpid(), info.hits, info.misses, info.maxsize, info.currsize)
+
+@app.get("/cache-stats")
+async def cache_stats():
+    """Report parse-cache hit rates so maxsize can be tuned from real traffic
+
+    Parsing runs inside the pool workers, each with its own cache, so the
+    counters are sampled through the pool and summed. Sampling is
+    best-effort: several probes per worker usually reach every process, but
+    an idle worker can be missed, so workers_sampled reports the coverage.
+    """
+    loop = asyncio.get_running_loop()
+    samples = await asyncio.gather(*[
+        loop.run_in_executor(_PROCESS_POOL, _worker_cache_info)
+        for _ in range(4 * _POOL_WORKERS)
+    ])
+    per_worker = {pid: counters for pid, *counters in samples}
+    return {
+        "workers_sampled": len(per_worker),
+        "hits": sum(c[0] for c in per_worker.values()),
+        "misses": sum(c[1] for c in per_worker.values()),
+        "maxsize": next(iter(per_worker.values()))[2] if per_worker else 0,
+        "currsize": sum(c[3] for c in per_worker.values()),
+    }
+
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # Hypercorn speaks HTTP/2 (h2c on the plain bind; supply certs for TLS+H2),
+    # so clients can multiplex parse requests over one connection
+    import uvloop
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+
+    uvloop.install()
+    config = Config()
+    config.bind = ["0.0.0.0:8000"]
+    config.keep_alive_timeout = 75
+    asyncio.run(serve(app, config))
\ No newline at end of file
@@ -0,0 +1,10 @@
+#!/bin/sh
+# Production launcher: a single Hypercorn worker is enough because the app's
+# own process pool already runs one NLP worker per core — more web workers
+# would multiply that pool per worker and oversubscribe the host
+exec hypercorn main:app \
+    --worker-class uvloop \
+    --bind 0.0.0.0:8000 \
+    --workers "${WORKERS:-1}" \
+    --keep-alive 75 \
+    --graceful-timeout 30
@@ -1,111 +1,207 @@
-#!/usr/bin/env python3
-import json
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel
+from typing import List, Dict, Any, Optional
+from contextlib import asynccontextmanager
+import asyncio
+import hashlib
+import logging
+import logging.handlers
 import os
-import sys
-from http.server import HTTPServer, BaseHTTPRequestHandler
-from urllib.request import urlopen, Request
-from urllib.parse import urlparse, parse_qs
-from urllib.error import HTTPError
-import threading
-import time
-
-# Load environment variables
-def load_env():
-    env_vars = {}
-    try:
-        with open('.env', 'r') as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith('#') and '=' in line:
-                    key, value = line.split('=', 1)
-                    env_vars[key] = value.strip('"').strip("'")
-    except FileNotFoundError:
-        pass
-    
-    # Update os.environ with loaded variables
-    for key, value in env_vars.items():
-        os.environ[key] = value
-    
-    return env_vars
-
-# Load environment variables
-load_env()
-
-class RecipeHandler(BaseHTTPRequestHandler):
-    def _send_response(self, status_code, data):
-        self.send_response(status_code)
-        self.send_header('Content-Type', 'application/json')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        self.end_headers()
-        
-        if isinstance(data, dict):
-            data = json.dumps(data)
-        
-        self.wfile.write(data.encode('utf-8'))
+import re
+from queue import SimpleQueue
+from cachetools import TTLCache
+from dotenv import load_dotenv
+from anthropic import AsyncAnthropic
+import httpx
+import orjson
 
-    def do_OPTIONS(self):
-        self._send_response(200, {})
+load_dotenv()
 
-    def do_GET(self):
-        if self.path == '/':
-            self._send_response(200, {
-                "service": "Meal Planner Service", 
-                "status": "running"
-            })
-        else:
-            self._send_response(404, {"detail": "Not Found"})
+def _setup_logging() -> logging.handlers.QueueListener:
+    """Send log records through a queue so the actual I/O happens on the
+    listener thread instead of blocking the event loop"""
+    queue = SimpleQueue()
+    listener = logging.handlers.QueueListener(queue, logging.StreamHandler())
+    listener.start()
+    root = logging.getLogger()
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    root.addHandler(logging.handlers.QueueHandler(queue))
+    return listener
 
-    def do_POST(self):
-        try:
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
-            request_data = json.loads(post_data.decode('utf-8'))
-            
-            if self.path == '/generate-meal-plan':
-                self._handle_meal_plan(request_data)
-            elif self.path == '/recipe-substitutions':
-                self._handle_substitutions(request_data)
-            else:
-                self._send_response(404, {"detail": "Endpoint not found"})
-                
-        except json.JSONDecodeError:
-            self._send_response(400, {"detail": "Invalid JSON"})
-        except Exception as e:
-            print(f"Error: {e}")
-            self._send_response(500, {"detail": str(e)})
-
-    def _handle_meal_plan(self, request_data):
-        # Extract request parameters
-        recipes = request_data.get('recipes', [])
-        days = request_data.get('days', 7)
-        preferences = request_data.get('preferences', {})
-        
-        print(f"Received meal plan request: {request_data}")
-        
-        # Build recipes text
-        recipes_text = []
-        for r in recipes:
-            recipe_text = f"""Recipe ID: {r.get('id')}
-Recipe: {r.get('title')}
-Ingredients: {', '.join(r.get('ingredients', []))}
-Servings: {r.get('servings')}
-Prep Time: {r.get('prepTime')} minutes
-Cook Time: {r.get('cookTime')} minutes
-Tags: {', '.join(r.get('tags', [])) if r.get('tags') else 'None'}"""
-            recipes_text.append(recipe_text)
-        
-        recipes_text_str = '\n\n'.join(recipes_text)
-        preferences_text = json.dumps(preferences, indent=2) if preferences else "No specific preferences"
-        
-        prompt = f"""You are a helpful meal planning assistant. Based on the following recipes available to the user, create a {days}-day meal plan.
+_log_listener = _setup_logging()
+
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run the micro-batch worker for the life of the process and close the
+    pooled HTTP client on the way out"""
+    worker = asyncio.create_task(_micro_batch_worker())
+    yield
+    worker.cancel()
+    await _http.aclose()
+
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+# One pooled HTTP client shared by every Anthropic call, so repeat requests
+# reuse warm TLS connections instead of paying a handshake each time
+_http = httpx.AsyncClient(
+    http2=True,
+    timeout=httpx.Timeout(60.0, connect=5.0),
+    limits=httpx.Limits(
+        max_keepalive_connections=100,
+        max_connections=200,
+        keepalive_expiry=120,
+    ),
+)
+
+anthropic_client = AsyncAnthropic(
+    api_key=os.getenv("ANTHROPIC_API_KEY"),
+    http_client=_http,
+)
+
+class Recipe(BaseModel):
+    id: str
+    title: str
+    ingredients: List[str]
+    instructions: str
+    servings: int
+    cookTime: int
+    prepTime: int
+    tags: List[str] = []
+
+class MealPlanRequest(BaseModel):
+    recipes: List[Recipe]
+    days: int = 7
+    preferences: Dict[str, Any] = {}
 
-Available Recipes:
-{recipes_text_str}
+class MealPlan(BaseModel):
+    week: List[Dict[str, Any]]
+    shopping_list: List[Dict[str, Any]]
+    notes: str
 
-User Preferences:
-{preferences_text}
+class MealPlanBatchItem(BaseModel):
+    meal_plan: Optional[MealPlan] = None
+    error: Optional[str] = None
+
+class MealPlanBatchResponse(BaseModel):
+    results: List[MealPlanBatchItem]
+
+class SubstitutionRequest(BaseModel):
+    recipeId: str
+    title: str
+    description: str = ""
+    ingredients: List[Dict[str, Any]]
+    instructions: str
+    prepTime: int = None
+    cookTime: int = None
+    servings: int = None
+    dietaryOptions: List[str] = []
+    specificIngredients: List[str] = []
+
+class SubstitutionResponse(BaseModel):
+    originalRecipe: Dict[str, Any]
+    substitutedRecipe: Dict[str, Any]
+
+@app.get("/")
+def read_root():
+    return {"service": "Meal Planner Service", "status": "running"}
+
+# Cap concurrent upstream calls so batches stay under Anthropic's rate limits
+_BATCH_CONCURRENCY = 8
+
+# Claude sometimes wraps its JSON in ```json fences; capture the payload in
+# one pass instead of repeated startswith/endswith trims
+_FENCE_RE = re.compile(r'^\s*```(?:json)?\s*(.*?)\s*```\s*$', re.DOTALL)
+
+def _extract_json_payload(response_text: str) -> str:
+    """Return the JSON body of a Claude reply, with any code fences removed"""
+    m = _FENCE_RE.match(response_text)
+    return m.group(1) if m else response_text.strip()
+
+def repair_json(partial: str) -> str:
+    """Best-effort repair of a truncated JSON fragment so it parses.
+
+    Single pass tracking string state, escapes and bracket depth: strips an
+    opening ```json fence, drops a dangling escape, closes an unterminated
+    string, trims a trailing comma or completes a dangling key with null,
+    and balances any open brackets. The result is meant to be fed to
+    orjson.loads inside a try block while tokens are still arriving.
+    """
+    text = partial.lstrip()
+    if text.startswith("```json"):
+        text = text[7:]
+    elif text.startswith("```"):
+        text = text[3:]
+    fence_end = text.find("```")
+    if fence_end != -1:
+        text = text[:fence_end]
+
+    stack = []
+    in_string = False
+    escaped = False
+    for ch in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append(ch)
+        elif ch in "}]":
+            if stack:
+                stack.pop()
+
+    if escaped:
+        text = text[:-1]
+    if in_string:
+        text += '"'
+    text = text.rstrip()
+    if text.endswith(','):
+        text = text[:-1]
+    elif text.endswith(':'):
+        text += ' null'
+    return text + ''.join('}' if c == '{' else ']' for c in reversed(stack))
+
+# Identical recipe sets + days + preferences produce identical prompts, so a
+# repeat request can reuse the earlier plan instead of paying another 5-20s
+# Claude round trip
+_PLAN_CACHE: TTLCache = TTLCache(maxsize=1024, ttl=3600)
+
+# In-flight Claude calls keyed by request hash; a concurrent duplicate awaits
+# the first caller's future instead of issuing its own upstream call
+_inflight: Dict[str, asyncio.Future] = {}
+
+def _meal_plan_cache_key(request: MealPlanRequest) -> str:
+    """Hash the canonicalized request so key order and recipe order don't matter"""
+    blob = orjson.dumps(
+        {
+            "recipes": sorted((r.model_dump() for r in request.recipes), key=lambda r: r["id"]),
+            "days": request.days,
+            "preferences": request.preferences,
+        },
+        option=orjson.OPT_SORT_KEYS,
+    )
+    return hashlib.blake2b(blob, digest_size=16).hexdigest()
+
+# All the static instruction prose lives in the system prompt; marking it
+# with cache_control lets Anthropic reuse the processed prefix across
+# requests, so repeat calls only bill the small dynamic user message
+MEAL_PLAN_SYSTEM_PROMPT = """You are a helpful meal planning assistant. The user message is a JSON object with "recipes" (the recipes available to the user, including their ids), "days" (how many days the plan must cover) and "preferences" (the user's preferences, which may be empty).
 
 Please create a meal plan that:
 1. Uses the available recipes efficiently
@@ -116,85 +212,53 @@ Please create a meal plan that:
 6. IMPORTANT: When using a recipe from the available list, include both the recipe title AND the recipe ID
 
 Return the response as a valid JSON object with this structure:
-{{
+{
     "week": [
-        {{
+        {
             "day": "Monday",
-            "breakfast": {{"recipe": "Recipe Title", "recipeId": "recipe-id-if-from-available-list", "notes": "Any modifications"}},
-            "lunch": {{"recipe": "Recipe Title", "recipeId": "recipe-id-if-from-available-list", "notes": "Any modifications"}},
-            "dinner": {{"recipe": "Recipe Title", "recipeId": "recipe-id-if-from-available-list", "notes": "Any modifications"}}
-        }},
+            "breakfast": {"recipe": "Recipe Title", "recipeId": "recipe-id-if-from-available-list", "notes": "Any modifications"},
+            "lunch": {"recipe": "Recipe Title", "recipeId": "recipe-id-if-from-available-list", "notes": "Any modifications"},
+            "dinner": {"recipe": "Recipe Title", "recipeId": "recipe-id-if-from-available-list", "notes": "Any modifications"}
+        },
         // ... more days
     ],
     "shopping_list": [
-        {{"item": "ingredient name", "quantity": "amount", "unit": "unit of measurement"}},
+        {"item": "ingredient name", "quantity": "amount", "unit": "unit of measurement"},
         // ... more items
     ],
     "notes": "General tips or suggestions for the meal plan"
-}}
+}
 
 Make sure to only use recipes from the available list. For breakfast, if no breakfast recipes are available, suggest simple options like "Toast and eggs" or "Yogurt and fruit" (these should NOT have a recipeId since they're not from the available recipes).
 
-IMPORTANT: 
+IMPORTANT:
 - If using a recipe from the available list, ALWAYS include the recipeId field with the exact ID provided
 - If suggesting a simple meal not from the list, do NOT include a recipeId field
 - Double-check that recipe IDs match exactly with the ones provided in the available recipes list"""
-        
-        try:
-            response = self._call_anthropic_api(prompt)
-            self._send_response(200, response)
-        except Exception as e:
-            print(f"Meal plan error: {e}")
-            self._send_response(500, {"detail": str(e)})
-
-    def _handle_substitutions(self, request_data):
-        # Extract request parameters
-        recipe_id = request_data.get('recipeId')
-        title = request_data.get('title')
-        description = request_data.get('description', '')
-        ingredients = request_data.get('ingredients', [])
-        instructions = request_data.get('instructions')
-        prep_time = request_data.get('prepTime')
-        cook_time = request_data.get('cookTime')
-        servings = request_data.get('servings')
-        dietary_options = request_data.get('dietaryOptions', [])
-        specific_ingredients = request_data.get('specificIngredients', [])
-        
-        if not recipe_id or not title or not ingredients or not instructions:
-            self._send_response(400, {"detail": "Missing required fields"})
-            return
-        
-        # Prepare ingredient list with specific ones marked for substitution
-        ingredients_list = []
-        for ing in ingredients:
-            needs_substitution = ing.get('id') in specific_ingredients
-            quantity = ing.get('quantity', '')
-            unit = ing.get('unit', '')
-            name = ing.get('name', '')
-            
-            ingredient_text = f"{quantity} {unit} {name}".strip()
-            if needs_substitution:
-                ingredient_text = f"[SUBSTITUTE] {ingredient_text}"
-            ingredients_list.append(ingredient_text)
-        
-        ingredients_text = '\n'.join(ingredients_list)
-        
-        # Build the prompt for Claude
-        prompt = f"""You are a professional chef helping to modify a recipe based on dietary requirements and ingredient substitutions.
 
-Original Recipe:
-Title: {title}
-{f"Description: {description}" if description else ""}
+# System blocks passed to the SDK; ephemeral cache_control marks the static
+# prefix as reusable on Anthropic's side
+MEAL_PLAN_SYSTEM = [
+    {
+        "type": "text",
+        "text": MEAL_PLAN_SYSTEM_PROMPT,
+        "cache_control": {"type": "ephemeral"},
+    }
+]
 
-Ingredients:
-{ingredients_text}
+# Addendum for micro-batched calls: several users' requests ride in one
+# prompt, and Claude returns one plan per request in order
+MEAL_PLAN_BATCH_SYSTEM = [
+    {
+        "type": "text",
+        "text": MEAL_PLAN_SYSTEM_PROMPT + """
 
-Instructions:
-{instructions}
+Alternatively, the user message may be a JSON object with a single key "requests" holding an array of several independent request objects of the shape described above. In that case, apply all of the instructions to each request separately and produce exactly one meal-plan object (with the structure above) per request, in the same order as the requests. Do not merge or share anything between the requests.""",
+        "cache_control": {"type": "ephemeral"},
+    }
+]
 
-Requested Modifications:
-{f"- Dietary requirements: {', '.join(dietary_options)}" if dietary_options else ""}
-{f"- Specific ingredients marked with [SUBSTITUTE] need alternatives" if specific_ingredients else ""}
+SUBSTITUTION_SYSTEM_PROMPT = """You are a professional chef helping to modify a recipe based on dietary requirements and ingredient substitutions. The user message contains the original recipe and the requested modifications; ingredients marked with [SUBSTITUTE] need alternatives.
 
 Please provide:
 1. A modified ingredients list with appropriate substitutions
@@ -202,135 +266,568 @@ Please provide:
 3. Important notes about the substitutions and how they affect the recipe
 
 Format your response as JSON with this structure:
-{{
+{
   "title": "Modified recipe title if needed",
   "description": "Updated description if needed",
   "ingredients": [
-    {{"name": "ingredient name", "quantity": "amount", "unit": "unit of measurement"}}
+    {"name": "ingredient name", "quantity": "amount", "unit": "unit of measurement"}
   ],
   "instructions": "Step-by-step instructions, separated by newlines",
   "substitutionNotes": "Detailed notes about the substitutions made and any important considerations"
-}}"""
-        
-        try:
-            claude_response = self._call_anthropic_api(prompt, parse_json=True)
-            
-            # Validate the response structure
-            if not claude_response.get('ingredients') or not claude_response.get('instructions') or not claude_response.get('substitutionNotes'):
-                self._send_response(500, {"detail": "Invalid response format from AI. Please try again."})
-                return
-            
-            response = {
-                "originalRecipe": {
-                    "title": title,
-                    "description": description,
-                    "instructions": instructions,
-                    "prepTime": prep_time,
-                    "cookTime": cook_time,
-                    "servings": servings,
+}"""
+
+SUBSTITUTION_SYSTEM = [
+    {
+        "type": "text",
+        "text": SUBSTITUTION_SYSTEM_PROMPT,
+        "cache_control": {"type": "ephemeral"},
+    }
+]
+
+# Opt in to Anthropic's prompt-caching beta so the cache_control marks above
+# actually take effect
+_PROMPT_CACHING_HEADERS = {"anthropic-beta": "prompt-caching-2024-07-31"}
+
+# Tool definitions for the buffered endpoints: forcing Claude to answer via a
+# tool call makes the output schema-checked JSON, so the handlers read a dict
+# straight off message.content[0].input — no fences, no loads, no parse-failure
+# branch. The streaming endpoints keep plain text mode since they need raw
+# tokens as they arrive.
+_MEAL_ENTRY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "recipe": {"type": "string"},
+        "recipeId": {"type": "string"},
+        "notes": {"type": "string"},
+    },
+    "required": ["recipe"],
+}
+
+_MEAL_PLAN_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "week": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "day": {"type": "string"},
+                    "breakfast": _MEAL_ENTRY_SCHEMA,
+                    "lunch": _MEAL_ENTRY_SCHEMA,
+                    "dinner": _MEAL_ENTRY_SCHEMA,
                 },
-                "substitutedRecipe": {
-                    "title": claude_response.get('title', title),
-                    "description": claude_response.get('description', description),
-                    "ingredients": claude_response['ingredients'],
-                    "instructions": claude_response['instructions'],
-                    "substitutionNotes": claude_response['substitutionNotes'],
-                }
+                "required": ["day", "breakfast", "lunch", "dinner"],
+            },
+        },
+        "shopping_list": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "item": {"type": "string"},
+                    "quantity": {"type": "string"},
+                    "unit": {"type": "string"},
+                },
+                "required": ["item"],
+            },
+        },
+        "notes": {"type": "string"},
+    },
+    "required": ["week", "shopping_list", "notes"],
+}
+
+MEAL_PLAN_TOOLS = [
+    {
+        "name": "emit_meal_plan",
+        "description": "Record the finished meal plan",
+        "input_schema": _MEAL_PLAN_SCHEMA,
+    }
+]
+MEAL_PLAN_TOOL_CHOICE = {"type": "tool", "name": "emit_meal_plan"}
+
+MEAL_PLAN_BATCH_TOOLS = [
+    {
+        "name": "emit_meal_plans",
+        "description": "Record one finished meal plan per request, in request order",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "plans": {"type": "array", "items": _MEAL_PLAN_SCHEMA},
+            },
+            "required": ["plans"],
+        },
+    }
+]
+MEAL_PLAN_BATCH_TOOL_CHOICE = {"type": "tool", "name": "emit_meal_plans"}
+
+SUBSTITUTION_TOOLS = [
+    {
+        "name": "emit_substituted_recipe",
+        "description": "Record the modified recipe with its substitutions",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "title": {"type": "string"},
+                "description": {"type": "string"},
+                "ingredients": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "name": {"type": "string"},
+                            "quantity": {"type": "string"},
+                            "unit": {"type": "string"},
+                        },
+                        "required": ["name"],
+                    },
+                },
+                "instructions": {"type": "string"},
+                "substitutionNotes": {"type": "string"},
+            },
+            "required": ["ingredients", "instructions", "substitutionNotes"],
+        },
+    }
+]
+SUBSTITUTION_TOOL_CHOICE = {"type": "tool", "name": "emit_substituted_recipe"}
+
+def _meal_plan_payload(request: MealPlanRequest) -> Dict[str, Any]:
+    """Shape the dynamic part of the prompt
+
+    Only the fields the planner actually needs are included (no instructions
+    text), keeping billable input tokens to a minimum.
+    """
+    return {
+        "recipes": [
+            {
+                "id": r.id,
+                "title": r.title,
+                "ingredients": r.ingredients,
+                "servings": r.servings,
+                "prepTime": r.prepTime,
+                "cookTime": r.cookTime,
+                "tags": r.tags,
             }
-            
-            self._send_response(200, response)
-            
-        except Exception as e:
-            print(f"Substitution error: {e}")
-            self._send_response(500, {"detail": "Failed to generate substitutions"})
-
-    def _call_anthropic_api(self, prompt, parse_json=False):
-        api_key = os.environ.get('ANTHROPIC_API_KEY')
-        if not api_key:
-            raise Exception("API key not configured. Please add ANTHROPIC_API_KEY to your environment variables.")
-        
-        # Prepare the request
-        url = "https://api.anthropic.com/v1/messages"
-        headers = {
-            'Content-Type': 'application/json',
-            'x-api-key': api_key,
-            'anthropic-version': '2023-06-01'
-        }
-        
-        data = {
-            "model": "claude-3-5-sonnet-20241022",
-            "max_tokens": 4096,
-            "temperature": 0.7,
-            "messages": [
+            for r in request.recipes
+        ],
+        "days": request.days,
+        "preferences": request.preferences,
+    }
+
+def _build_meal_plan_user_message(request: MealPlanRequest) -> str:
+    """Render the dynamic part of the prompt as compact JSON"""
+    return orjson.dumps(_meal_plan_payload(request)).decode()
+
+# Micro-batching: distinct requests that arrive within a short window are
+# combined into one Claude call so they share the round trip and the cached
+# system prefix, instead of queuing up N separate upstream calls
+_MICRO_BATCH_WINDOW = 0.05  # seconds to wait for more requests to arrive
+
+# A single plan gets a 4000-token budget, and the model's output ceiling is
+# 8192, so a combined call can only carry as many plans as fit under that
+# ceiling — oversized batches would truncate mid-plan and fail every waiter
+_PLAN_TOKEN_BUDGET = 4000
+_MODEL_MAX_OUTPUT_TOKENS = 8192
+_MICRO_BATCH_MAX = _MODEL_MAX_OUTPUT_TOKENS // _PLAN_TOKEN_BUDGET
+
+_batch_queue: "asyncio.Queue[tuple]" = asyncio.Queue()
+
+# Strong references to in-flight batch tasks; the event loop only keeps weak
+# ones, so an unreferenced task could be collected mid-flight and leave its
+# waiters' futures unresolved
+_batch_tasks: set = set()
+
+async def _run_micro_batch(batch: List[tuple]) -> None:
+    """Serve one drained batch: a lone request takes the normal path, a
+    larger one rides a single combined prompt; each waiter gets its plan
+    (or the failure) through its future"""
+    futures = [future for _, future in batch]
+    try:
+        if len(batch) == 1:
+            plans = [await _generate_meal_plan_uncached(batch[0][0])]
+        else:
+            combined = await asyncio.to_thread(
+                lambda: orjson.dumps(
+                    {"requests": [_meal_plan_payload(request) for request, _ in batch]}
+                ).decode()
+            )
+            message = await anthropic_client.messages.create(
+                model="claude-3-5-sonnet-20241022",
+                max_tokens=len(batch) * _PLAN_TOKEN_BUDGET,
+                temperature=0.7,
+                system=MEAL_PLAN_BATCH_SYSTEM,
+                extra_headers=_PROMPT_CACHING_HEADERS,
+                tools=MEAL_PLAN_BATCH_TOOLS,
+                tool_choice=MEAL_PLAN_BATCH_TOOL_CHOICE,
+                messages=[
+                    {
+                        "role": "user",
+                        "content": combined
+                    }
+                ]
+            )
+            plans_data = message.content[0].input.get("plans")
+            if not isinstance(plans_data, list) or len(plans_data) != len(batch):
+                raise HTTPException(
+                    status_code=500,
+                    detail="Batched response did not contain one plan per request"
+                )
+            plans = [
+                MealPlan.model_construct(
+                    week=data.get("week", []),
+                    shopping_list=data.get("shopping_list", []),
+                    notes=data.get("notes", "")
+                )
+                for data in plans_data
+            ]
+        for future, plan in zip(futures, plans):
+            if not future.done():
+                future.set_result(plan)
+    except Exception as e:
+        logger.exception("Micro-batched meal plan generation failed")
+        for future in futures:
+            if not future.done():
+                future.set_exception(e)
+
+async def _micro_batch_worker() -> None:
+    """Drain the queue in windows of up to _MICRO_BATCH_MAX requests"""
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await _batch_queue.get()]
+        deadline = loop.time() + _MICRO_BATCH_WINDOW
+        while len(batch) < _MICRO_BATCH_MAX:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(_batch_queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        # Serve the batch in its own task so the worker can keep collecting
+        # the next window while Claude generates
+        task = asyncio.create_task(_run_micro_batch(batch))
+        _batch_tasks.add(task)
+        task.add_done_callback(_batch_tasks.discard)
+
+async def _generate_meal_plan(request: MealPlanRequest) -> MealPlan:
+    """Return a cached plan, join an in-flight duplicate, or call Claude"""
+    cache_key = _meal_plan_cache_key(request)
+    cached_plan = _PLAN_CACHE.get(cache_key)
+    if cached_plan is not None:
+        return cached_plan
+
+    # Coalesce simultaneous identical requests onto one upstream call
+    pending = _inflight.get(cache_key)
+    if pending is not None:
+        return await pending
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[cache_key] = future
+    try:
+        result_future = asyncio.get_running_loop().create_future()
+        await _batch_queue.put((request, result_future))
+        plan = await result_future
+        _PLAN_CACHE[cache_key] = plan
+        future.set_result(plan)
+        return plan
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        _inflight.pop(cache_key, None)
+
+async def _generate_meal_plan_uncached(request: MealPlanRequest) -> MealPlan:
+    """Call Claude with the rendered prompt and parse the result"""
+    try:
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Received meal plan request with %d recipes", len(request.recipes))
+        # Rendering a large recipe set is pure CPU work; do it in a thread so
+        # the event loop keeps accepting other requests meanwhile
+        user_message = await asyncio.to_thread(_build_meal_plan_user_message, request)
+
+        message = await anthropic_client.messages.create(
+            model="claude-3-5-sonnet-20241022",
+            max_tokens=_PLAN_TOKEN_BUDGET,
+            temperature=0.7,
+            system=MEAL_PLAN_SYSTEM,
+            extra_headers=_PROMPT_CACHING_HEADERS,
+            tools=MEAL_PLAN_TOOLS,
+            tool_choice=MEAL_PLAN_TOOL_CHOICE,
+            messages=[
                 {
                     "role": "user",
-                    "content": prompt
+                    "content": user_message
                 }
             ]
-        }
-        
-        # Make the HTTP request
-        req = Request(url, data=json.dumps(data).encode('utf-8'), headers=headers)
-        
+        )
+
+        # The forced tool call hands back a schema-checked dict directly
+        meal_plan_data = message.content[0].input
+
+        return MealPlan.model_construct(
+            week=meal_plan_data.get("week", []),
+            shopping_list=meal_plan_data.get("shopping_list", []),
+            notes=meal_plan_data.get("notes", "")
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Meal plan generation failed")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _meal_plan_request_from_dict(data: Dict[str, Any]) -> MealPlanRequest:
+    """Shape a raw request body into the models without full validation
+
+    The fields only ever feed the prompt builder and cache key, so per-field
+    Pydantic validation buys nothing on this hot path; only the outermost
+    shape is checked at the call site.
+    """
+    return MealPlanRequest.model_construct(
+        recipes=[Recipe.model_construct(**r) for r in data["recipes"]],
+        days=data.get("days", 7),
+        preferences=data.get("preferences", {}),
+    )
+
+@app.post("/generate-meal-plan", response_model=None)
+async def generate_meal_plan(request: Request) -> MealPlan:
+    try:
+        data = orjson.loads(await request.body())
+    except orjson.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Request body is not valid JSON")
+    if not isinstance(data, dict) or not isinstance(data.get("recipes"), list):
+        raise HTTPException(status_code=422, detail="recipes must be a list")
+    # Each recipe must at least carry an id: the cache key and prompt builder
+    # index it directly
+    if not all(isinstance(r, dict) and "id" in r for r in data["recipes"]):
+        raise HTTPException(status_code=422, detail="each recipe must be an object with an id")
+    return await _generate_meal_plan(_meal_plan_request_from_dict(data))
+
+@app.post("/generate-meal-plan-stream")
+async def generate_meal_plan_stream(request: MealPlanRequest):
+    """Stream the meal plan as SSE so the client renders tokens as they arrive
+
+    Time-to-first-byte drops from full-generation time (many seconds) to
+    first-token latency. The buffered /generate-meal-plan endpoint stays for
+    clients that want the parsed JSON in one piece.
+    """
+    user_message = await asyncio.to_thread(_build_meal_plan_user_message, request)
+
+    async def event_stream():
+        chunks = []
+        emitted_days = 0
+        async with anthropic_client.messages.stream(
+            model="claude-3-5-sonnet-20241022",
+            max_tokens=4000,
+            temperature=0.7,
+            system=MEAL_PLAN_SYSTEM,
+            extra_headers=_PROMPT_CACHING_HEADERS,
+            messages=[
+                {
+                    "role": "user",
+                    "content": user_message
+                }
+            ]
+        ) as stream:
+            async for text in stream.text_stream:
+                chunks.append(text)
+                try:
+                    partial = orjson.loads(repair_json("".join(chunks)))
+                except orjson.JSONDecodeError:
+                    continue
+                week = partial.get("week") if isinstance(partial, dict) else None
+                if not isinstance(week, list):
+                    continue
+                # The last entry may still be mid-generation, so hold it back
+                for day in week[emitted_days:len(week) - 1]:
+                    yield b"data: " + orjson.dumps({"day": day}) + b"\n\n"
+                emitted_days = max(emitted_days, len(week) - 1)
+
+        # Emit the complete, unrepaired plan once generation finishes
         try:
-            with urlopen(req, timeout=60) as response:
-                response_data = json.loads(response.read().decode('utf-8'))
-                
-                if response_data.get('content') and len(response_data['content']) > 0:
-                    response_text = response_data['content'][0].get('text', '')
-                    
-                    if parse_json:
-                        # Extract JSON from the response
-                        response_text = response_text.strip()
-                        if response_text.startswith('```json'):
-                            response_text = response_text[7:]
-                        if response_text.endswith('```'):
-                            response_text = response_text[:-3]
-                        response_text = response_text.strip()
-                        
-                        try:
-                            return json.loads(response_text)
-                        except json.JSONDecodeError as e:
-                            print(f"Failed to parse Claude response: {response_text}")
-                            raise Exception("Failed to parse substitution suggestions. Please try again.")
-                    else:
-                        # For meal planning, parse the JSON response
-                        response_text = response_text.strip()
-                        if response_text.startswith('```json'):
-                            response_text = response_text[7:]
-                        if response_text.endswith('```'):
-                            response_text = response_text[:-3]
-                        response_text = response_text.strip()
-                        
-                        try:
-                            meal_plan_data = json.loads(response_text)
-                            return {
-                                "week": meal_plan_data.get("week", []),
-                                "shopping_list": meal_plan_data.get("shopping_list", []),
-                                "notes": meal_plan_data.get("notes", "")
-                            }
-                        except json.JSONDecodeError as e:
-                            raise Exception(f"Failed to parse Claude's response: {str(e)}")
-                else:
-                    raise Exception("No content in Claude's response")
-                    
-        except HTTPError as e:
-            if e.code == 401:
-                raise Exception("API key not configured properly.")
-            else:
-                raise Exception(f"Claude API error: {e}")
-        except Exception as e:
-            raise Exception(f"Failed to call Claude API: {str(e)}")
-
-def run_server():
-    port = 8001
-    server = HTTPServer(('0.0.0.0', port), RecipeHandler)
-    print(f"Meal Planner Service running on http://localhost:{port}")
+            plan = orjson.loads(_extract_json_payload("".join(chunks)))
+            yield b"data: " + orjson.dumps({"plan": plan}) + b"\n\n"
+        except orjson.JSONDecodeError:
+            logger.warning("Streamed meal plan did not parse as JSON")
+        yield b"data: [DONE]\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+@app.post("/generate-meal-plan-batch", response_model=None)
+async def generate_meal_plan_batch(requests: List[MealPlanRequest]) -> MealPlanBatchResponse:
+    """Generate meal plans for several requests concurrently"""
+    semaphore = asyncio.Semaphore(_BATCH_CONCURRENCY)
+
+    async def _generate_one(r: MealPlanRequest) -> MealPlan:
+        async with semaphore:
+            return await _generate_meal_plan(r)
+
+    results = await asyncio.gather(
+        *[_generate_one(r) for r in requests],
+        return_exceptions=True
+    )
+
+    # Report per-item outcomes so one failure doesn't poison the batch
+    items = []
+    for result in results:
+        if isinstance(result, HTTPException):
+            items.append(MealPlanBatchItem.model_construct(meal_plan=None, error=str(result.detail)))
+        elif isinstance(result, Exception):
+            items.append(MealPlanBatchItem.model_construct(meal_plan=None, error=str(result)))
+        else:
+            items.append(MealPlanBatchItem.model_construct(meal_plan=result, error=None))
+
+    return MealPlanBatchResponse.model_construct(results=items)
+
+# (recipeId, dietaryOptions, specificIngredients) is low-cardinality — the
+# same recipe gets the same handful of modifications asked for over and over
+# — so repeat substitution requests can reuse the earlier answer just like
+# repeat meal-plan requests do
+_SUBSTITUTION_CACHE: TTLCache = TTLCache(maxsize=2048, ttl=3600)
+
+def _substitution_cache_key(request: SubstitutionRequest) -> str:
+    """Hash the canonicalized request so key and option order don't matter"""
+    blob = orjson.dumps(
+        {
+            "recipeId": request.recipeId,
+            "ingredients": request.ingredients,
+            "instructions": request.instructions,
+            "dietaryOptions": sorted(request.dietaryOptions),
+            "specificIngredients": sorted(request.specificIngredients),
+        },
+        option=orjson.OPT_SORT_KEYS,
+    )
+    return hashlib.blake2b(blob, digest_size=16).hexdigest()
+
+def _build_substitution_prompt(request: SubstitutionRequest) -> str:
+    """Render the dynamic part of the substitution prompt
+
+    Only the recipe and requested changes go in the user message; the chef
+    instructions live in the cached system block.
+    """
+    # Prepare ingredient list with specific ones marked for substitution;
+    # frozenset makes the per-ingredient membership test O(1)
+    specific_set = frozenset(request.specificIngredients)
+    ingredients_list = []
+    for ing in request.ingredients:
+        prefix = "[SUBSTITUTE] " if ing.get('id') in specific_set else ""
+        ingredients_list.append(
+            prefix + f"{ing.get('quantity', '')} {ing.get('unit', '')} {ing.get('name', '')}".strip()
+        )
+
+    ingredients_text = '\n'.join(ingredients_list)
+
+    return f"""Original Recipe:
+Title: {request.title}
+{f"Description: {request.description}" if request.description else ""}
+
+Ingredients:
+{ingredients_text}
+
+Instructions:
+{request.instructions}
+
+Requested Modifications:
+{f"- Dietary requirements: {', '.join(request.dietaryOptions)}" if request.dietaryOptions else ""}
+{f"- Specific ingredients marked with [SUBSTITUTE] need alternatives" if request.specificIngredients else ""}"""
+
+@app.post("/recipe-substitutions-stream")
+async def generate_recipe_substitutions_stream(request: SubstitutionRequest):
+    """Stream the substituted recipe as SSE for progressive rendering
+
+    Mirrors /generate-meal-plan-stream; the buffered endpoint below stays for
+    clients that want the parsed JSON in one piece.
+    """
+    prompt = await asyncio.to_thread(_build_substitution_prompt, request)
+
+    async def event_stream():
+        async with anthropic_client.messages.stream(
+            model="claude-3-5-sonnet-20241022",
+            max_tokens=4096,
+            temperature=0.7,
+            system=SUBSTITUTION_SYSTEM,
+            extra_headers=_PROMPT_CACHING_HEADERS,
+            messages=[
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ]
+        ) as stream:
+            async for text in stream.text_stream:
+                yield b"data: " + orjson.dumps({"text": text}) + b"\n\n"
+        yield b"data: [DONE]\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+@app.post("/recipe-substitutions", response_model=None)
+async def generate_recipe_substitutions(request: SubstitutionRequest) -> SubstitutionResponse:
+    cache_key = _substitution_cache_key(request)
+    cached_response = _SUBSTITUTION_CACHE.get(cache_key)
+    if cached_response is not None:
+        return cached_response
+
     try:
-        server.serve_forever()
-    except KeyboardInterrupt:
-        print("\nShutting down server...")
-        server.shutdown()
+        prompt = await asyncio.to_thread(_build_substitution_prompt, request)
+
+        message = await anthropic_client.messages.create(
+            model="claude-3-5-sonnet-20241022",
+            max_tokens=4096,
+            temperature=0.7,
+            system=SUBSTITUTION_SYSTEM,
+            extra_headers=_PROMPT_CACHING_HEADERS,
+            tools=SUBSTITUTION_TOOLS,
+            tool_choice=SUBSTITUTION_TOOL_CHOICE,
+            messages=[
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ]
+        )
+
+        # The forced tool call hands back a schema-checked dict directly
+        substituted_recipe = message.content[0].input
+
+        # Validate the response structure
+        if not substituted_recipe.get('ingredients') or not substituted_recipe.get('instructions') or not substituted_recipe.get('substitutionNotes'):
+            raise HTTPException(status_code=500, detail="Invalid response format from AI. Please try again.")
+        
+        # Both dicts are shaped right here, so skip re-validation
+        response = SubstitutionResponse.model_construct(
+            originalRecipe={
+                "title": request.title,
+                "description": request.description,
+                "instructions": request.instructions,
+                "prepTime": request.prepTime,
+                "cookTime": request.cookTime,
+                "servings": request.servings,
+            },
+            substitutedRecipe={
+                "title": substituted_recipe.get('title', request.title),
+                "description": substituted_recipe.get('description', request.description),
+                "ingredients": substituted_recipe['ingredients'],
+                "instructions": substituted_recipe['instructions'],
+                "substitutionNotes": substituted_recipe['substitutionNotes'],
+            }
+        )
+        _SUBSTITUTION_CACHE[cache_key] = response
+        return response
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Substitution generation failed")
+        raise HTTPException(status_code=500, detail="Failed to generate substitutions")
+
+if __name__ == "__main__":
+    # Hypercorn speaks HTTP/2 (h2c on the plain bind; supply certs for TLS+H2),
+    # so the front end can multiplex requests over one connection
+    import uvloop
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
 
-if __name__ == '__main__':
-    run_server()
\ No newline at end of file
+    uvloop.install()
+    config = Config()
+    config.bind = ["0.0.0.0:8001"]
+    config.keep_alive_timeout = 75
+    asyncio.run(serve(app, config))
\ No newline at end of file
@@ -0,0 +1,10 @@
+#!/bin/sh
+# Production launcher: requests spend nearly all their time awaiting
+# Anthropic, so run more workers than cores and let async concurrency
+# carry the rest
+exec hypercorn main:app \
+    --worker-class uvloop \
+    --bind 0.0.0.0:8001 \
+    --workers "${WORKERS:-$((2 * $(nproc)))}" \
+    --keep-alive 75 \
+    --graceful-timeout 30
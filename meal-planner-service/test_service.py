@@ -1,22 +1,94 @@
 #!/usr/bin/env python3
-import json
-import urllib.request
-import urllib.parse
+"""Concurrent smoke test for the meal planner service.
 
-def test_service():
+Fires many parallel requests through one pooled httpx.AsyncClient so the
+checks reuse keepalive connections and actually exercise the concurrency
+the server must support, then prints a latency/error report.
+"""
+import asyncio
+import time
+
+import httpx
+
+BASE_URL = "http://localhost:8001"
+HEALTH_CHECKS = 50
+
+SAMPLE_MEAL_PLAN_REQUEST = {
+    "recipes": [
+        {
+            "id": "smoke-1",
+            "title": "Veggie Stir Fry",
+            "ingredients": ["2 cups broccoli", "1 bell pepper", "1 tbsp soy sauce"],
+            "instructions": "Chop vegetables. Stir fry over high heat. Add sauce.",
+            "servings": 2,
+            "cookTime": 15,
+            "prepTime": 10,
+            "tags": ["vegetarian", "quick"],
+        },
+        {
+            "id": "smoke-2",
+            "title": "Lentil Soup",
+            "ingredients": ["1 cup lentils", "1 onion", "4 cups vegetable broth"],
+            "instructions": "Saute onion. Add lentils and broth. Simmer 30 minutes.",
+            "servings": 4,
+            "cookTime": 35,
+            "prepTime": 10,
+            "tags": ["vegetarian", "soup"],
+        },
+    ],
+    "days": 3,
+    "preferences": {},
+}
+
+async def _timed_get(client: httpx.AsyncClient, path: str):
+    start = time.perf_counter()
     try:
-        # Test health endpoint
-        req = urllib.request.Request('http://localhost:8001/')
-        with urllib.request.urlopen(req, timeout=5) as response:
-            data = json.loads(response.read().decode('utf-8'))
-            print("Health check:", data)
-            return True
+        response = await client.get(path)
+        return response.status_code, time.perf_counter() - start, None
     except Exception as e:
-        print(f"Service test failed: {e}")
-        return False
+        return None, time.perf_counter() - start, e
+
+async def _timed_post(client: httpx.AsyncClient, path: str, payload: dict):
+    start = time.perf_counter()
+    try:
+        response = await client.post(path, json=payload)
+        return response.status_code, time.perf_counter() - start, None
+    except Exception as e:
+        return None, time.perf_counter() - start, e
+
+def _report(label: str, results) -> bool:
+    ok = [latency for status, latency, error in results if status == 200]
+    failed = [(status, error) for status, latency, error in results if status != 200]
+    if ok:
+        print(f"{label}: {len(ok)}/{len(results)} ok, "
+              f"min {min(ok) * 1000:.1f}ms / avg {sum(ok) / len(ok) * 1000:.1f}ms / "
+              f"max {max(ok) * 1000:.1f}ms")
+    for status, error in failed:
+        print(f"{label}: FAILED ({error if error is not None else f'HTTP {status}'})")
+    return not failed
+
+async def test_service() -> bool:
+    async with httpx.AsyncClient(base_url=BASE_URL, timeout=60.0) as client:
+        try:
+            # Parallel health checks over the shared keepalive pool
+            health_results = await asyncio.gather(
+                *[_timed_get(client, "/") for _ in range(HEALTH_CHECKS)]
+            )
+            healthy = _report(f"GET / x{HEALTH_CHECKS}", health_results)
+
+            # One real generation request (needs ANTHROPIC_API_KEY server-side)
+            plan_result = await _timed_post(
+                client, "/generate-meal-plan", SAMPLE_MEAL_PLAN_REQUEST
+            )
+            plan_ok = _report("POST /generate-meal-plan", [plan_result])
+
+            return healthy and plan_ok
+        except Exception as e:
+            print(f"Service test failed: {e}")
+            return False
 
 if __name__ == '__main__':
-    if test_service():
+    if asyncio.run(test_service()):
         print("✅ Service is running correctly!")
     else:
-        print("❌ Service is not responding")
\ No newline at end of file
+        print("❌ Service is not responding")